@@ -1,23 +1,30 @@
 from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
 from fastapi import FastAPI, Query, Request
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import FileResponse, StreamingResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.background import BackgroundTask
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+import anyio
 import asyncio
+import collections
+import functools
+import heapq
+import importlib.util
 import json
 import logging
+import secrets
 import shutil
 import sys
 import os
 import re
-import uuid
 import time
 import tempfile
-import subprocess
+import weakref
 from pathlib import Path
 
 
@@ -28,6 +35,8 @@ LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
 ALLOWED_ORIGIN = os.environ.get("ALLOWED_ORIGIN", "*")
 MAX_CONCURRENT_SEARCHES = int(os.environ.get("MAX_CONCURRENT_SEARCHES", "3"))
 SEARCH_TIMEOUT = int(os.environ.get("SEARCH_TIMEOUT", "300"))  # 5 min default
+# limits storage backend for rate-limit counters, e.g. redis://host:6379
+RATE_LIMIT_STORAGE_URI = os.environ.get("RATE_LIMIT_STORAGE_URI", "memory://")
 
 logging.basicConfig(
     level=getattr(logging, LOG_LEVEL, logging.INFO),
@@ -36,6 +45,7 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Sherlock path detection (multi-platform)
+@functools.cache
 def _find_sherlock() -> str | None:
     env_path = os.environ.get("SHERLOCK_PATH")
     if env_path and os.path.isfile(env_path):
@@ -70,7 +80,19 @@ def _find_sherlock() -> str | None:
 
 
 SHERLOCK_PATH = _find_sherlock()
-if SHERLOCK_PATH:
+SHERLOCK_ARGS = ("--print-all", "--no-color")
+
+# When sherlock-project is importable from this interpreter (and no explicit
+# SHERLOCK_PATH is set), searches run on pre-started workers instead of
+# paying for a fresh interpreter and Sherlock's imports on every request.
+SHERLOCK_WORKERS = (
+    not os.environ.get("SHERLOCK_PATH")
+    and importlib.util.find_spec("sherlock_project") is not None
+)
+
+if SHERLOCK_WORKERS:
+    logger.info(f"Sherlock module found; using pre-started workers on {sys.executable}")
+elif SHERLOCK_PATH:
     logger.info(f"Sherlock found at: {SHERLOCK_PATH}")
 else:
     logger.warning("Sherlock executable NOT found. Set SHERLOCK_PATH env var or install sherlock-project.")
@@ -84,42 +106,227 @@ os.makedirs(RESULTS_DIR, exist_ok=True)
 
 CLEANUP_AGE = 60 * 10  # 10 minutes
 CLEANUP_INTERVAL = 60 * 5  # run every 5 minutes
+CLEANUP_SWEEP_TICKS = 3  # full directory sweep on startup and every 3rd run
+
+# Result files awaiting cleanup as a min-heap of (expiry, path), so each
+# sweep only touches files that are actually due.
+_pending_files: list[tuple[float, str]] = []
+# Current expiry of each scheduled file. Heap entries that no longer match
+# (rescheduled, or removed after download) are skipped when they come up.
+_file_expiry: dict[str, float] = {}
+
+
+@dataclass
+class SearchHandle:
+    """A running Sherlock process and the event that signals its cancellation."""
+    process: asyncio.subprocess.Process
+    cancel_event: asyncio.Event = field(default_factory=asyncio.Event)
+
+
+# Active searches keyed by search_id for cancellation. Entries disappear
+# once the stream that owns the handle finishes.
+_active_searches: "weakref.WeakValueDictionary[str, SearchHandle]" = weakref.WeakValueDictionary()
+
+
+class SearchAdmission:
+    """Counts running searches and rejects new ones once the limit is reached."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.active = 0
+        self.cond = asyncio.Condition()
+
+    async def try_acquire(self) -> bool:
+        """Claim a search slot without waiting. Returns False when all slots are taken."""
+        async with self.cond:
+            if self.active >= self.capacity:
+                return False
+            self.active += 1
+            return True
+
+    async def release(self):
+        async with self.cond:
+            self.active -= 1
+            self.cond.notify(1)
+
+
+_search_admission = SearchAdmission(MAX_CONCURRENT_SEARCHES)
 
-# Active search processes keyed by search_id for cancellation
-_active_searches: dict[str, subprocess.Popen] = {}
-_search_semaphore = asyncio.Semaphore(MAX_CONCURRENT_SEARCHES)
+
+# Worker entry point: imports Sherlock up front, then blocks until it is
+# handed a username on stdin and runs the regular CLI with it.
+_WORKER_BOOTSTRAP = f"""\
+import sys
+# -c puts the working directory (a shared temp dir) first on sys.path;
+# drop it so nothing planted there can shadow Sherlock or its dependencies.
+if sys.path and sys.path[0] == "":
+    del sys.path[0]
+from sherlock_project.sherlock import main
+username = sys.stdin.readline().strip()
+sys.argv = ["sherlock", username, *{SHERLOCK_ARGS!r}]
+main()
+"""
+
+
+async def _spawn_worker() -> asyncio.subprocess.Process:
+    return await asyncio.create_subprocess_exec(
+        sys.executable,
+        "-c",
+        _WORKER_BOOTSTRAP,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+        cwd=_SPECTER_TEMP,
+    )
+
+
+class SherlockPool:
+    """Keeps Sherlock worker processes started ahead of the searches that use them.
+
+    Each worker runs a single search and exits; a replacement is started in
+    the background as soon as an idle worker is taken.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._idle: list[asyncio.subprocess.Process] = []
+        self._spawning: set[asyncio.Task] = set()
+        self._closed = True
+
+    def start(self):
+        self._closed = False
+        for _ in range(self.size):
+            self._spawn_soon()
+
+    def _spawn_soon(self):
+        task = asyncio.create_task(self._add_worker())
+        self._spawning.add(task)
+        task.add_done_callback(self._spawning.discard)
+
+    async def _add_worker(self):
+        try:
+            process = await _spawn_worker()
+        except Exception:
+            logger.exception("Failed to start Sherlock worker")
+            return
+        if self._closed:
+            process.kill()
+            await process.wait()
+            return
+        self._idle.append(process)
+
+    async def run(self, username: str) -> asyncio.subprocess.Process:
+        """Start a search for username, on an idle worker when one is ready."""
+        process = None
+        while self._idle:
+            candidate = self._idle.pop()
+            self._spawn_soon()
+            if candidate.returncode is None:
+                process = candidate
+                break
+        if process is None:
+            process = await _spawn_worker()
+        process.stdin.write(username.encode() + b"\n")
+        await process.stdin.drain()
+        process.stdin.close()
+        return process
+
+    async def close(self):
+        self._closed = True
+        for task in self._spawning:
+            task.cancel()
+        idle, self._idle = self._idle, []
+        for process in idle:
+            if process.returncode is None:
+                process.kill()
+            await process.wait()
+
+
+_sherlock_pool = SherlockPool(MAX_CONCURRENT_SEARCHES) if SHERLOCK_WORKERS else None
+
+
+async def _start_sherlock(username: str) -> asyncio.subprocess.Process:
+    if _sherlock_pool:
+        return await _sherlock_pool.run(username)
+    return await asyncio.create_subprocess_exec(
+        SHERLOCK_PATH,
+        username,
+        *SHERLOCK_ARGS,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+        cwd=_SPECTER_TEMP,
+    )
 
 # Username validation
-_USERNAME_RE = re.compile(r"^[a-zA-Z0-9._-]{1,64}$")
+_USERNAME_RE = re.compile(r"[a-zA-Z0-9._-]{1,64}")
 
 
 def _validate_username(username: str) -> str | None:
     """Return an error message if the username is invalid, else None."""
+    # The regex enforces both length and charset; the individual checks
+    # below only run to pick the message for a rejected username.
+    if _USERNAME_RE.fullmatch(username):
+        return None
     if not username:
         return "Username cannot be empty."
     if len(username) > 64:
         return "Username is too long (max 64 characters)."
-    if not _USERNAME_RE.match(username):
-        return "Username contains invalid characters. Only letters, numbers, '.', '_' and '-' are allowed."
-    return None
+    return "Username contains invalid characters. Only letters, numbers, '.', '_' and '-' are allowed."
 
 
 # Cleanup loop
+def _schedule_cleanup(path: str, delay: float = CLEANUP_AGE):
+    """Schedule a result file for removal after delay seconds, replacing any earlier expiry."""
+    expiry = time.time() + delay
+    _file_expiry[path] = expiry
+    heapq.heappush(_pending_files, (expiry, path))
+
+
+def _remove_stale_files(now: float, scheduled: frozenset[str]):
+    """Remove result files older than CLEANUP_AGE that are not scheduled on the heap.
+
+    This is the backstop for files this process never scheduled: leftovers
+    from a previous run, files written by another worker sharing
+    RESULTS_DIR, or reports whose scheduling was skipped. Runs in a worker
+    thread.
+    """
+    with os.scandir(RESULTS_DIR) as entries:
+        for entry in entries:
+            if entry.path in scheduled:
+                continue
+            try:
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                if now - entry.stat(follow_symlinks=False).st_mtime > CLEANUP_AGE:
+                    os.remove(entry.path)
+                    logger.info(f"Removed stale result file: {entry.path}")
+            except FileNotFoundError:
+                pass
+            except Exception:
+                logger.exception(f"Error while cleaning file: {entry.path}")
+
+
 async def _cleanup_results_loop():
     logger.info("Result cleanup loop started")
     try:
+        tick = 0
         while True:
             now = time.time()
-            for name in os.listdir(RESULTS_DIR):
-                path = os.path.join(RESULTS_DIR, name)
+            while _pending_files and _pending_files[0][0] <= now:
+                expiry, path = heapq.heappop(_pending_files)
+                if _file_expiry.get(path) != expiry:
+                    continue
+                del _file_expiry[path]
                 try:
-                    if os.path.isfile(path):
-                        mtime = os.path.getmtime(path)
-                        if now - mtime > CLEANUP_AGE:
-                            os.remove(path)
-                            logger.info(f"Removed stale result file: {path}")
+                    await asyncio.to_thread(os.remove, path)
+                    logger.info(f"Removed stale result file: {path}")
+                except FileNotFoundError:
+                    pass
                 except Exception:
                     logger.exception(f"Error while cleaning file: {path}")
+            if tick % CLEANUP_SWEEP_TICKS == 0:
+                await asyncio.to_thread(_remove_stale_files, now, frozenset(_file_expiry))
+            tick += 1
             await asyncio.sleep(CLEANUP_INTERVAL)
     except asyncio.CancelledError:
         logger.info("Result cleanup loop cancelled")
@@ -127,7 +334,11 @@ async def _cleanup_results_loop():
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     task = asyncio.create_task(_cleanup_results_loop())
+    if _sherlock_pool:
+        _sherlock_pool.start()
     yield
+    if _sherlock_pool:
+        await _sherlock_pool.close()
     task.cancel()
     try:
         await task
@@ -137,8 +348,10 @@ async def lifespan(app: FastAPI):
 
 app = FastAPI(lifespan=lifespan)
 
-# Rate limiting
-limiter = Limiter(key_func=get_remote_address)
+# Rate limiting. Counters expire with their window in both the in-memory and
+# Redis backends, so per-IP state stays bounded by the clients seen in the
+# last minute.
+limiter = Limiter(key_func=get_remote_address, storage_uri=RATE_LIMIT_STORAGE_URI)
 app.state.limiter = limiter
 
 
@@ -146,32 +359,233 @@ app.state.limiter = limiter
 async def _rate_limit_handler(request: Request, exc: RateLimitExceeded):
     return JSONResponse({"error": "Too many requests. Try again later."}, status_code=429)
 
-# Security headers middleware
-class SecurityHeadersMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        response = await call_next(request)
-        response.headers["X-Content-Type-Options"] = "nosniff"
-        response.headers["X-Frame-Options"] = "DENY"
-        response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
-        response.headers["Permissions-Policy"] = "camera=(), microphone=(), geolocation=()"
-        response.headers["X-XSS-Protection"] = "1; mode=block"
-        return response
+# Security headers middleware. Implemented as plain ASGI rather than
+# BaseHTTPMiddleware, which runs every response (including the SSE stream)
+# through an extra task and memory stream.
+_SECURITY_HEADERS = [
+    (b"x-content-type-options", b"nosniff"),
+    (b"x-frame-options", b"DENY"),
+    (b"referrer-policy", b"strict-origin-when-cross-origin"),
+    (b"permissions-policy", b"camera=(), microphone=(), geolocation=()"),
+    (b"x-xss-protection", b"1; mode=block"),
+]
+
+
+class SecurityHeadersMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_headers(message: Message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", ()), *_SECURITY_HEADERS]
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
 
 
 app.add_middleware(SecurityHeadersMiddleware)
 
+# CORS for ALLOWED_ORIGIN="*". Without credentials every response gets the
+# same headers, so they are precomputed instead of matching origins per request.
+_CORS_HEADERS = [(b"access-control-allow-origin", b"*")]
+_CORS_PREFLIGHT_HEADERS = [
+    (b"access-control-allow-origin", b"*"),
+    (b"access-control-allow-methods", b"GET, POST"),
+    (b"access-control-allow-headers", b"*"),
+    (b"access-control-max-age", b"600"),
+]
+
+
+class PublicCORSMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if scope["method"] == "OPTIONS" and any(
+            name == b"access-control-request-method" for name, _ in scope["headers"]
+        ):
+            await send({"type": "http.response.start", "status": 204, "headers": _CORS_PREFLIGHT_HEADERS})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        async def send_with_headers(message: Message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", ()), *_CORS_HEADERS]
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+
 # Configure CORS
-_origins = [ALLOWED_ORIGIN] if ALLOWED_ORIGIN != "*" else ["*"]
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=_origins,
-    allow_credentials=(ALLOWED_ORIGIN != "*"),
-    allow_methods=["GET", "POST"],
-    allow_headers=["*"],
-)
+if ALLOWED_ORIGIN == "*":
+    app.add_middleware(PublicCORSMiddleware)
+else:
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=[ALLOWED_ORIGIN],
+        allow_credentials=True,
+        allow_methods=["GET", "POST"],
+        allow_headers=["*"],
+    )
+
+
+class ResultsFile:
+    """Downloadable file of a search's positive results.
+
+    The file is created on the first hit and each hit is appended as it
+    arrives, with all file I/O done in a worker thread. Each write is
+    shielded from cancellation of its caller and close() waits for it, so a
+    cancelled reader can neither leave a half-created file behind nor race
+    the close.
+    """
+
+    def __init__(self, username: str):
+        self.username = username
+        self.filename: str | None = None
+        self.filepath: str | None = None
+        self.count = 0
+        self.failed = False
+        self._fh = None
+        self._io: asyncio.Future | None = None
+
+    async def write(self, line: str):
+        self.count += 1
+        if self.failed:
+            return
+        self._io = asyncio.ensure_future(self._write(line))
+        await asyncio.shield(self._io)
+
+    async def _write(self, line: str):
+        try:
+            if self._fh is None:
+                filename = f"{self.username}_{secrets.token_hex(16)}.txt"
+                filepath = os.path.join(RESULTS_DIR, filename)
+                self._fh = await asyncio.to_thread(open, filepath, "w", encoding="utf-8")
+                self.filename, self.filepath = filename, filepath
+                # Fallback in case close() never runs; close() re-arms it
+                # to CLEANUP_AGE after the file is complete.
+                _schedule_cleanup(filepath, SEARCH_TIMEOUT + CLEANUP_AGE)
+            await asyncio.to_thread(self._fh.write, line + "\n")
+        except Exception:
+            logger.exception("Failed to write results file")
+            self.failed = True
+
+    async def close(self):
+        if self._io:
+            await self._io
+        if self._fh is None:
+            return
+        fh, self._fh = self._fh, None
+        try:
+            await asyncio.to_thread(fh.close)
+        except Exception:
+            logger.exception("Failed to write results file")
+            self.failed = True
+        # Expire the report CLEANUP_AGE after it is complete, not after its first hit
+        _schedule_cleanup(self.filepath)
+
+    @property
+    def download_url(self) -> str | None:
+        if self.filename is None or self.failed:
+            return None
+        return f"/download/{self.filename}"
+
+
+# Sherlock output is read in large chunks and split into lines here rather
+# than awaiting one readline() per site. Lines longer than _MAX_LINE are
+# dropped instead of being buffered without bound.
+_READ_CHUNK = 64 * 1024
+_MAX_LINE = 1 << 20
+
+
+async def _read_line_batches(stream: asyncio.StreamReader):
+    """Yield the complete lines (as bytes) available after each chunk read."""
+    parts: list[bytes] = []  # pieces of the current incomplete line
+    size = 0
+    dropping = False  # inside a line that exceeded _MAX_LINE
+    while chunk := await stream.read(_READ_CHUNK):
+        lines = chunk.split(b"\n")
+        last = lines.pop()
+        if lines:
+            if dropping:
+                del lines[0]
+                dropping = False
+            elif parts:
+                parts.append(lines[0])
+                lines[0] = b"".join(parts)
+            parts, size = [], 0
+        if last and not dropping:
+            parts.append(last)
+            size += len(last)
+            if size > _MAX_LINE:
+                parts, size, dropping = [], 0, True
+        if lines:
+            yield lines
+    if parts:
+        yield [b"".join(parts)]
+
+
+# Result lines are coalesced into one event of up to RESULT_BATCH_SIZE lines,
+# flushed at the latest RESULT_BATCH_DELAY seconds after its first line.
+# Only the lines themselves are JSON-encoded; the rest of the payload is a
+# pre-built template.
+RESULT_BATCH_SIZE = 16
+RESULT_BATCH_DELAY = 0.05
+_RESULTS_EVENT = 'data: {"results": [%s], "checked": %d, "total": ' + str(TOTAL_SITES) + '}\n\n'
+
+# Parsed result lines are handed from the stdout reader to the SSE stream
+# through a bounded queue, so a slow client only stalls Sherlock once the
+# queue is full rather than on every event.
+RESULT_QUEUE_SIZE = 128
+_READER_DONE = object()
+
+
+async def _drain_stdout(
+    process: asyncio.subprocess.Process,
+    queue: asyncio.Queue,
+    results: ResultsFile,
+    other_output: collections.deque,
+):
+    """Queue (JSON-encoded line, checked count) for every result line of the output.
+
+    Other lines are kept in other_output (bounded) for error reporting.
+    Finishes with _READER_DONE, or with the exception that stopped the reader.
+    """
+    checked = 0
+    try:
+        async for lines in _read_line_batches(process.stdout):
+            for line in lines:
+                line = line.strip()
+
+                # Skip non-result lines (update notices, banners, etc.)
+                if line[:1] != b"[" or line[2:3] != b"]" or line[1:2] not in b"+-!":
+                    if line:
+                        other_output.append(line)
+                    continue
+
+                # Count checked sites
+                checked += 1
+                line_str = line.decode("utf-8", "replace")
+                if line[1:2] == b"+":
+                    await results.write(line_str)
+
+                await queue.put((json.dumps(line_str), checked))
+    except Exception as e:
+        await queue.put(e)
+        return
+    await queue.put(_READER_DONE)
 
 
-def run_sherlock(username: str, search_id: str):
+async def run_sherlock(username: str, search_id: str):
     """Runs sherlock as a subprocess and yields SSE events with progress."""
     username = username.strip()
 
@@ -181,125 +595,179 @@ def run_sherlock(username: str, search_id: str):
         yield f"data: {json.dumps({'error': err})}\n\n"
         return
 
-    if not SHERLOCK_PATH:
+    if not SHERLOCK_PATH and not _sherlock_pool:
         logger.error("Sherlock executable not found")
         yield f"data: {json.dumps({'error': 'Sherlock not found on the server. Set SHERLOCK_PATH or install sherlock-project.'})}\n\n"
         return
 
-    command = [SHERLOCK_PATH, username, "--print-all", "--no-color"]
-    positive_results: list[str] = []
+    results = ResultsFile(username)
     process = None
+    timeout_handle = None
+    reader_task = None
+    get_task = None
+    cancel_task = None
     checked = 0
-    start_time = time.monotonic()
+    timed_out = False
+
+    def _on_timeout(handle: SearchHandle):
+        nonlocal timed_out
+        timed_out = True
+        logger.warning(f"Search {search_id} timed out after {SEARCH_TIMEOUT}s")
+        if handle.process.returncode is None:
+            handle.process.kill()
+        # Stop the stream directly; EOF may never come if a child of the
+        # process still holds the pipe open.
+        handle.cancel_event.set()
 
     try:
-        process = subprocess.Popen(
-            command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            bufsize=1,
-            universal_newlines=True,
-            cwd=_SPECTER_TEMP,
-        )
-        _active_searches[search_id] = process
-
-        for line in process.stdout:
-            # If the process was cancelled externally, stop
-            if search_id not in _active_searches:
-                break
+        process = await _start_sherlock(username)
+        handle = SearchHandle(process)
+        _active_searches[search_id] = handle
+        cancel_task = asyncio.ensure_future(handle.cancel_event.wait())
+        # Enforce the timeout once for the whole search instead of on every read
+        loop = asyncio.get_running_loop()
+        timeout_handle = loop.call_later(SEARCH_TIMEOUT, _on_timeout, handle)
 
-            # Enforce timeout
-            if time.monotonic() - start_time > SEARCH_TIMEOUT:
-                logger.warning(f"Search {search_id} timed out after {SEARCH_TIMEOUT}s")
-                yield f"data: {json.dumps({'error': 'Search timed out.'})}\n\n"
-                break
+        queue: asyncio.Queue = asyncio.Queue(maxsize=RESULT_QUEUE_SIZE)
+        other_output: collections.deque = collections.deque(maxlen=20)
+        reader_task = asyncio.create_task(_drain_stdout(process, queue, results, other_output))
 
-            line_str = line.strip()
-            if not line_str:
-                continue
+        batch: list[str] = []
+        flush_at = 0.0
 
-            # Skip non-result lines (update notices, banners, etc.)
-            if not line_str.startswith(("[+]", "[-]", "[!]")):
-                continue
+        while True:
+            # Stop as soon as the search is cancelled, even mid-read
+            if cancel_task.done():
+                break
+            if get_task is None and not queue.empty():
+                item = queue.get_nowait()
+            else:
+                if get_task is None:
+                    get_task = asyncio.ensure_future(queue.get())
+                # Wait for more output, but no longer than the pending batch may be held
+                timeout = max(flush_at - loop.time(), 0) if batch else None
+                done, _ = await asyncio.wait(
+                    {get_task, cancel_task}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if get_task not in done:
+                    if batch:
+                        yield _RESULTS_EVENT % (", ".join(batch), checked)
+                        batch = []
+                    continue
+                item, get_task = get_task.result(), None
+
+            if item is _READER_DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
 
-            # Count checked sites
-            if line_str.startswith(("[+]", "[-]", "[!]")):
-                checked += 1
+            line, checked = item
+            if not batch:
+                flush_at = loop.time() + RESULT_BATCH_DELAY
+            batch.append(line)
+            if len(batch) >= RESULT_BATCH_SIZE:
+                yield _RESULTS_EVENT % (", ".join(batch), checked)
+                batch = []
 
-            if line_str.startswith("[+]"):
-                positive_results.append(line_str)
+        if batch:
+            yield _RESULTS_EVENT % (", ".join(batch), checked)
 
-            yield f"data: {json.dumps({'result': line_str, 'checked': checked, 'total': TOTAL_SITES})}\n\n"
+        if timed_out:
+            yield f"data: {json.dumps({'error': 'Search timed out.'})}\n\n"
 
-        if process:
+        # A cancelled or timed-out process is reaped in the finally block below
+        if not handle.cancel_event.is_set():
             try:
-                process.wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                process.kill()
-                process.wait()
+                await asyncio.wait_for(process.wait(), timeout=5)
+            except asyncio.TimeoutError:
+                pass
             logger.info(f"Sherlock finished with code {process.returncode}")
 
+            # Sherlock exited without checking a single site, e.g. a worker
+            # whose import of sherlock_project failed
+            if checked == 0 and process.returncode is not None:
+                output = b"\n".join(other_output).decode("utf-8", "replace")
+                logger.error(
+                    f"Sherlock exited with code {process.returncode} without results. Output:\n{output}"
+                )
+                yield f"data: {json.dumps({'error': f'Sherlock failed to run (exit code {process.returncode}).'})}\n\n"
+
     except Exception as e:
         logger.exception(f"Error running sherlock: {e}")
         yield f"data: {json.dumps({'error': f'Error running sherlock: {str(e)}'})}\n\n"
         return
     finally:
+        # When the client disconnects, Starlette cancels its task group and
+        # every await below is cancelled again, so stop everything
+        # synchronously first and shield only the reaping.
+        if timeout_handle:
+            timeout_handle.cancel()
+        for task in (get_task, cancel_task, reader_task):
+            if task:
+                task.cancel()
         _active_searches.pop(search_id, None)
-        if process:
+        terminated = False
+        if process and process.returncode is None:
             try:
-                if process.stdout:
-                    process.stdout.close()
-                if process.poll() is None:
-                    process.terminate()
+                process.terminate()
+                terminated = True
+            except ProcessLookupError:
+                pass
+
+        with anyio.CancelScope(shield=True):
+            if reader_task:
+                await asyncio.gather(reader_task, return_exceptions=True)
+            if terminated:
+                try:
+                    await asyncio.wait_for(process.wait(), timeout=2)
+                except asyncio.TimeoutError:
                     try:
-                        process.wait(timeout=2)
-                    except subprocess.TimeoutExpired:
                         process.kill()
-            except Exception:
-                pass
+                    except ProcessLookupError:
+                        pass
+            await results.close()
 
-    # Build download file
-    download_url = None
-    positive_count = len(positive_results)
-    if positive_results:
-        filename = f"{username}_{uuid.uuid4().hex}.txt"
-        filepath = os.path.join(RESULTS_DIR, filename)
-        try:
-            with open(filepath, "w", encoding="utf-8") as f:
-                f.write("\n".join(positive_results))
-            download_url = f"/download/{filename}"
-        except Exception:
-            logger.exception("Failed to write results file")
+    yield f"data: {json.dumps({'message': 'done', 'download': results.download_url, 'count': results.count})}\n\n"
 
-    yield f"data: {json.dumps({'message': 'done', 'download': download_url, 'count': positive_count})}\n\n"
+
+class SearchStreamResponse(StreamingResponse):
+    """Streaming response that gives back the admission slot claimed by /search.
+
+    Releasing here rather than in the stream generator also covers clients
+    that disconnect before the generator has started.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await _search_admission.release()
 
 
 # Main search endpoint
 @app.get("/search")
 @limiter.limit("5/minute")
 async def search(request: Request, username: str = Query(..., min_length=1, max_length=64)):
-    if _search_semaphore.locked() and _search_semaphore._value == 0:
+    if not await _search_admission.try_acquire():
         return JSONResponse(
             {"error": "Server is busy. Please try again shortly."},
             status_code=503,
         )
 
-    search_id = uuid.uuid4().hex
+    search_id = secrets.token_hex(16)
 
-    async def _guarded_stream():
-        async with _search_semaphore:
-            # Send search_id as first event so the client can use it for cancellation
-            yield f"data: {json.dumps({'search_id': search_id})}\n\n"
-            for chunk in run_sherlock(username, search_id):
-                yield chunk
+    async def _search_stream():
+        # Send search_id as first event so the client can use it for cancellation
+        yield f"data: {json.dumps({'search_id': search_id})}\n\n"
+        async for chunk in run_sherlock(username, search_id):
+            yield chunk
 
     headers = {
         "X-Search-Id": search_id,
         "Cache-Control": "no-cache",
     }
-    return StreamingResponse(
-        _guarded_stream(),
+    return SearchStreamResponse(
+        _search_stream(),
         media_type="text/event-stream",
         headers=headers,
     )
@@ -308,20 +776,29 @@ async def search(request: Request, username: str = Query(..., min_length=1, max_
 @app.post("/cancel/{search_id}")
 async def cancel_search(search_id: str):
     """Cancel a running search by its search_id."""
-    process = _active_searches.pop(search_id, None)
-    if process is None:
+    handle = _active_searches.get(search_id)
+    if handle is None:
         return JSONResponse({"status": "not_found"}, status_code=404)
+    # The search stream stops on the event and reaps the process itself
+    handle.cancel_event.set()
     try:
-        process.terminate()
-        try:
-            process.wait(timeout=3)
-        except subprocess.TimeoutExpired:
-            process.kill()
+        if handle.process.returncode is None:
+            handle.process.terminate()
     except Exception:
         logger.exception("Error terminating search process")
     return {"status": "cancelled"}
 
 
+def _remove_result_file(path: str):
+    """Delete a result file once its download response has been sent."""
+    try:
+        os.remove(path)
+        _file_expiry.pop(path, None)
+        logger.info(f"Deleted result file: {path}")
+    except Exception:
+        logger.exception("Failed to delete result file after download")
+
+
 _SAFE_FILENAME_RE = re.compile(r"[\w\-]+_[0-9a-f]{32}\.txt")
 
 # Download endpoint
@@ -334,22 +811,11 @@ async def download_file(filename: str):
     if not os.path.exists(full_path):
         return JSONResponse({"error": "file not found"}, status_code=404)
 
-    def file_iterator(path: str):
-        try:
-            with open(path, "rb") as fh:
-                for chunk in iter(lambda: fh.read(8192), b""):
-                    yield chunk
-        finally:
-            try:
-                os.remove(path)
-                logger.info(f"Deleted result file: {path}")
-            except Exception:
-                logger.exception("Failed to delete result file after download")
-
-    return StreamingResponse(
-        file_iterator(full_path),
+    return FileResponse(
+        full_path,
         media_type="application/octet-stream",
-        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        filename=filename,
+        background=BackgroundTask(_remove_result_file, full_path),
     )
 
 # Serve the frontend static files (index.html, main.js, style.css)
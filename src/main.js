@@ -97,16 +97,20 @@ searchButton.addEventListener('click', () => {
             return;
         }
 
-        if (data.result) {
-            const el = document.createElement('div');
-            el.textContent = data.result;
-
-            if (data.result.startsWith('[+]')) {
-                el.className = 'result-found';
-            } else if (data.result.startsWith('[-]') || data.result.startsWith('[!]')) {
-                el.className = 'result-not-found';
+        if (data.results) {
+            const fragment = document.createDocumentFragment();
+            for (const result of data.results) {
+                const el = document.createElement('div');
+                el.textContent = result;
+
+                if (result.startsWith('[+]')) {
+                    el.className = 'result-found';
+                } else if (result.startsWith('[-]') || result.startsWith('[!]')) {
+                    el.className = 'result-not-found';
+                }
+                fragment.appendChild(el);
             }
-            resultsContainer.appendChild(el);
+            resultsContainer.appendChild(fragment);
             resultsContainer.scrollTop = resultsContainer.scrollHeight;
         }
 
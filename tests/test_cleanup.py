@@ -0,0 +1,25 @@
+import os
+import time
+
+from src.backend import main
+
+
+def _result_file(directory, name, age):
+    path = directory / name
+    path.write_text("[+] Site: https://site.example/alice\n")
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+    return str(path)
+
+
+def test_sweep_removes_only_stale_unscheduled_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "RESULTS_DIR", str(tmp_path))
+    stale = _result_file(tmp_path, "stale.txt", main.CLEANUP_AGE + 60)
+    fresh = _result_file(tmp_path, "fresh.txt", 0)
+    scheduled = _result_file(tmp_path, "scheduled.txt", main.CLEANUP_AGE + 60)
+
+    main._remove_stale_files(time.time(), frozenset({scheduled}))
+
+    assert not os.path.exists(stale)
+    assert os.path.exists(fresh)
+    assert os.path.exists(scheduled)
@@ -0,0 +1,91 @@
+import os
+import socket
+import sys
+import textwrap
+import threading
+import time
+
+import pytest
+import uvicorn
+
+from src.backend import main
+
+
+def _wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def _process_exists(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+@pytest.fixture
+def sherlock_stub(tmp_path, monkeypatch):
+    """A fake sherlock executable that records its pid and prints results slowly."""
+    pid_file = tmp_path / "sherlock.pid"
+    script = tmp_path / "sherlock"
+    script.write_text(textwrap.dedent(f"""\
+        #!{sys.executable}
+        import os, sys, time
+        with open({str(pid_file)!r}, "w") as fh:
+            fh.write(str(os.getpid()))
+        for i in range(300):
+            print(f"[{{'+' if i % 5 == 0 else '-'}}] Site{{i}}: https://site{{i}}.example/{{sys.argv[1]}}", flush=True)
+            time.sleep(0.1)
+    """))
+    script.chmod(0o755)
+    monkeypatch.setattr(main, "SHERLOCK_PATH", str(script))
+    monkeypatch.setattr(main, "_sherlock_pool", None)
+    return pid_file
+
+
+@pytest.fixture
+def server():
+    config = uvicorn.Config(main.app, host="127.0.0.1", port=0, log_level="warning")
+    srv = uvicorn.Server(config)
+    thread = threading.Thread(target=srv.run, daemon=True)
+    thread.start()
+    assert _wait_until(lambda: srv.started)
+    yield srv.servers[0].sockets[0].getsockname()[:2]
+    srv.should_exit = True
+    thread.join(timeout=10)
+
+
+def test_client_disconnect_terminates_sherlock(sherlock_stub, server):
+    with socket.create_connection(server) as sock:
+        sock.sendall(b"GET /search?username=alice HTTP/1.1\r\nHost: test\r\n\r\n")
+        received = b""
+        while b'"results"' not in received:
+            received += sock.recv(4096)
+
+    pid = int(sherlock_stub.read_text())
+    assert _wait_until(lambda: not _process_exists(pid), timeout=3)
+    assert _wait_until(lambda: not main._active_searches)
+
+
+def test_disconnected_search_schedules_result_file_cleanup(sherlock_stub, server):
+    with socket.create_connection(server) as sock:
+        sock.sendall(b"GET /search?username=bob HTTP/1.1\r\nHost: test\r\n\r\n")
+        received = b""
+        while b'"results"' not in received:
+            received += sock.recv(4096)
+
+    def scheduled():
+        return [
+            expiry for path, expiry in main._file_expiry.items()
+            if os.path.basename(path).startswith("bob_")
+        ]
+
+    # The partial report is re-armed to CLEANUP_AGE once the stream is torn down
+    assert _wait_until(lambda: any(
+        expiry <= time.time() + main.CLEANUP_AGE for expiry in scheduled()
+    ))
@@ -0,0 +1,49 @@
+import asyncio
+import os
+import subprocess
+import sys
+
+from src.backend import main
+
+
+def _fake_sherlock_package(root, message):
+    package = root / "sherlock_project"
+    package.mkdir(parents=True)
+    (package / "__init__.py").write_text("")
+    (package / "sherlock.py").write_text(f"def main():\n    print({message!r})\n")
+
+
+def test_worker_does_not_import_from_its_working_directory(tmp_path):
+    cwd = tmp_path / "cwd"
+    installed = tmp_path / "site"
+    _fake_sherlock_package(cwd, "planted")
+    _fake_sherlock_package(installed, "installed")
+
+    result = subprocess.run(
+        [sys.executable, "-c", main._WORKER_BOOTSTRAP],
+        cwd=cwd,
+        env={**os.environ, "PYTHONPATH": str(installed)},
+        input="alice\n",
+        capture_output=True,
+        text=True,
+        timeout=30,
+    )
+
+    assert result.stdout.strip() == "installed"
+
+
+async def _collect(events):
+    return [event async for event in events]
+
+
+def test_broken_sherlock_install_reports_an_error(tmp_path, monkeypatch):
+    broken = tmp_path / "site" / "sherlock_project"
+    broken.mkdir(parents=True)
+    (broken / "__init__.py").write_text("")
+    (broken / "sherlock.py").write_text("import missing_dependency_for_test\n")
+    monkeypatch.setenv("PYTHONPATH", str(tmp_path / "site"))
+    monkeypatch.setattr(main, "_sherlock_pool", main.SherlockPool(1))
+
+    events = asyncio.run(_collect(main.run_sherlock("alice", "broken-install")))
+
+    assert any('"error": "Sherlock failed to run (exit code 1).' in event for event in events)